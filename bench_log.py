@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""Замер скорости обработки лога сборки: pump -> writer -> parser
+
+Использование: python3 bench_log.py [число_строк]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bot import BuildLogWriter, BuildOutputParser, pump_build_output
+
+def synthetic_output(lines: int) -> bytes:
+    """Вывод, похожий на kbuild: CC/LD строки, редкие warning/error"""
+    out = [b"Using kernel name: bench_kernel\n", b"Building kernel with 8 cores...\n"]
+    for i in range(lines):
+        if i % 50000 == 0:
+            out.append(b"drivers/bench/file%d.c:40:1: error: expected ';'\n" % i)
+        elif i % 1000 == 0:
+            out.append(b"drivers/bench/file%d.c:12:5: warning: unused variable 'x'\n" % i)
+        else:
+            out.append(b"  CC      drivers/bench/subsystem/file%d.o\n" % i)
+    return b"".join(out)
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    data = synthetic_output(lines)
+    read_fd, write_fd = os.pipe()
+
+    def feed():
+        with os.fdopen(write_fd, 'wb') as pipe:
+            pipe.write(data)
+
+    feeder = threading.Thread(target=feed)
+    with tempfile.TemporaryFile() as log_file, os.fdopen(read_fd, 'rb') as stream:
+        writer = BuildLogWriter(log_file)
+        parser = BuildOutputParser()
+        writer.subscribe(parser.feed)
+        writer.start()
+        feeder.start()
+        started = time.perf_counter()
+        pump_build_output(stream, writer)
+        writer.close()
+        elapsed = time.perf_counter() - started
+    feeder.join()
+    print(f"{writer.lines} lines in {elapsed:.2f}s: {writer.lines / elapsed:,.0f} lines/s end-to-end, "
+          f"{writer.lines_per_second:,.0f} lines/s in writer+parser")
+
+if __name__ == "__main__":
+    main()
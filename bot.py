@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 import os
+import re
 import subprocess
 import logging
 import shutil
+import asyncio
+import threading
+import queue
+import time
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from telegram import Update, InputFile, BotCommand
+from telegram.error import TelegramError, RetryAfter, NetworkError, BadRequest, TimedOut
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -36,7 +45,31 @@ ESP_IP = os.getenv("ESP_IP")
 ESP_ENABLED = os.getenv("ESP_ENABLED", "false").lower() == "true"  # Новый параметр
 MAX_LOG_FILES = 10
 
+def parse_chat_ids(value: str):
+    """Список чатов из строки вида 123,-100456,@channel"""
+    chats = []
+    for item in value.split(","):
+        item = item.strip()
+        if item:
+            chats.append(int(item) if item.lstrip("-").isdigit() else item)
+    return chats
+
+# Подписчики уведомлений о сборке; по умолчанию все события уходят в CHAT_ID
+NOTIFY_EVENTS = ("started", "progress", "success", "failure")
+NOTIFY_SUBSCRIBERS = {
+    event: parse_chat_ids(os.getenv(f"NOTIFY_{event.upper()}", CHAT_ID or ""))
+    for event in NOTIFY_EVENTS
+}
+NOTIFY_CHAT_INTERVAL = 1.0  # Не чаще одного сообщения в секунду в один чат
+NOTIFY_GLOBAL_INTERVAL = 1 / 30  # Общий лимит Telegram ~30 сообщений в секунду
+NOTIFY_MAX_RETRIES = 3
+NOTIFY_UPLOAD_TIMEOUT = 300  # Таймаут записи при загрузке архива/лога в Telegram
+LOG_CHUNK_SIZE = 64 * 1024  # Размер блока чтения вывода build.sh
+LOG_QUEUE_SIZE = 64  # Максимум блоков в очереди на запись
+
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+KERNEL_DIR = os.path.abspath(os.path.join(PROJECT_DIR, ".."))  # Как в build.sh
+PATCHES_DIR = os.path.join(PROJECT_DIR, "patches")
 LOG_DIR = os.path.join(PROJECT_DIR, "logs")
 os.makedirs(LOG_DIR, exist_ok=True)
 
@@ -79,6 +112,158 @@ def check_esp8266_status():
     except Exception as e:
         return False, f"🔴 Offline ({str(e)})"
 
+class NotificationDispatcher:
+    """Рассылка уведомлений о сборке: своя очередь на каждый чат, лимиты и повторы"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.queues = {}
+        self.workers = {}
+        self.chat_last_send = {}
+        self.last_send = 0.0
+        self.send_lock = asyncio.Lock()
+
+    def recipients(self, event, origin_chat_id=None):
+        chats = [origin_chat_id] if origin_chat_id is not None else []
+        for chat_id in NOTIFY_SUBSCRIBERS.get(event, []):
+            if chat_id not in chats:
+                chats.append(chat_id)
+        return chats
+
+    def notify(self, event, text, origin_chat_id=None, parse_mode='Markdown'):
+        """Поставить сообщение в очереди получателей, не дожидаясь отправки"""
+        for chat_id in self.recipients(event, origin_chat_id):
+            self._enqueue(chat_id, lambda chat_id=chat_id: self._send(
+                chat_id, self.bot.send_message, text=text, parse_mode=parse_mode
+            ))
+
+    def notify_document(self, event, path, filename, caption, origin_chat_id=None):
+        """Файл загружается один раз, остальным получателям уходит его file_id"""
+        chats = self.recipients(event, origin_chat_id)
+        if not chats:
+            return
+        # Загрузка идёт сразу, вне очередей чатов, чтобы не ждать их лимитов
+        uploaded = asyncio.create_task(self._upload(chats, path, filename, caption))
+
+        async def deliver(chat_id):
+            file_id, uploaded_to = await asyncio.shield(uploaded)
+            if chat_id == uploaded_to:
+                return
+            if not file_id:
+                logger.error(f"Document {filename} not delivered to chat {chat_id}: upload failed")
+                return
+            await self._send(chat_id, self.bot.send_document, document=file_id, caption=caption)
+
+        for chat_id in chats:
+            self._enqueue(chat_id, lambda chat_id=chat_id: deliver(chat_id))
+
+    async def _upload(self, chats, path, filename, caption):
+        """Загрузить файл в первый чат; при неудаче - ещё одна попытка (в следующий чат)"""
+        for chat_id in (chats + chats)[:2]:
+            message = await self._send(
+                chat_id, self.bot.send_document, path=path, filename=filename, caption=caption,
+                write_timeout=NOTIFY_UPLOAD_TIMEOUT
+            )
+            if message:
+                return message.document.file_id, chat_id
+        return None, None
+
+    def _enqueue(self, chat_id, job):
+        if chat_id not in self.queues:
+            self.queues[chat_id] = asyncio.Queue()
+            self.workers[chat_id] = asyncio.create_task(self._worker(chat_id, self.queues[chat_id]))
+        self.queues[chat_id].put_nowait(job)
+
+    async def _worker(self, chat_id, jobs):
+        while True:
+            job = await jobs.get()
+            try:
+                await job()
+            except Exception:
+                logger.exception(f"Notification to chat {chat_id} failed")
+            finally:
+                jobs.task_done()
+
+    async def _throttle(self, chat_id):
+        loop = asyncio.get_running_loop()
+        delay = self.chat_last_send.get(chat_id, 0.0) + NOTIFY_CHAT_INTERVAL - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with self.send_lock:
+            delay = self.last_send + NOTIFY_GLOBAL_INTERVAL - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.last_send = loop.time()
+        self.chat_last_send[chat_id] = loop.time()
+
+    async def _send(self, chat_id, method, path=None, filename=None, **kwargs):
+        for attempt in range(1, NOTIFY_MAX_RETRIES + 1):
+            await self._throttle(chat_id)
+            try:
+                if path:
+                    with open(path, "rb") as f:
+                        return await method(chat_id=chat_id, document=InputFile(f, filename=filename), **kwargs)
+                return await method(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                delay = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+            except BadRequest as e:
+                if kwargs.get("parse_mode"):
+                    # Например, несбалансированная Markdown-разметка: отправляем как текст
+                    logger.warning(f"Notification to chat {chat_id} rejected ({e}), resending without Markdown")
+                    return await self._send(chat_id, method, path, filename, **{**kwargs, "parse_mode": None})
+                logger.error(f"Notification to chat {chat_id} rejected: {e}")
+                return None
+            except TimedOut as e:
+                if path or "document" in kwargs:
+                    # Файл мог дойти: повтор рискует дублем
+                    logger.error(f"Document to chat {chat_id} timed out, not retrying: {e}")
+                    return None
+                delay = 2 ** attempt
+            except NetworkError as e:
+                delay = 2 ** attempt
+            except TelegramError as e:
+                logger.error(f"Notification to chat {chat_id} failed: {e}")
+                return None
+            if attempt < NOTIFY_MAX_RETRIES:
+                logger.warning(f"Notification to chat {chat_id}, attempt {attempt} failed, retry in {delay}s")
+                await asyncio.sleep(delay)
+        logger.error(f"Notification to chat {chat_id} failed after {NOTIFY_MAX_RETRIES} attempts")
+        return None
+
+    async def drain(self, timeout=30):
+        """Дождаться отправки очередей (пока HTTP-клиент бота ещё открыт)"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(jobs.join() for jobs in self.queues.values())), timeout
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Notification queues not drained before shutdown")
+
+    def stop(self):
+        """Остановить обработчики очередей"""
+        for worker in self.workers.values():
+            worker.cancel()
+
+notifier = None
+
+async def post_init(application):
+    global notifier
+    notifier = NotificationDispatcher(application.bot)
+    await setup_commands(application)
+
+async def post_stop(application):
+    # post_shutdown вызывается после закрытия HTTP-клиента бота, поэтому
+    # очереди нужно разобрать раньше
+    if notifier:
+        await notifier.drain()
+
+async def post_shutdown(application):
+    if notifier:
+        notifier.stop()
+    if patch_check_pool:
+        await asyncio.to_thread(patch_check_pool.shutdown, cancel_futures=True)
+
 async def setup_commands(application):
     commands = [
         BotCommand("start", "Запустить бота"),
@@ -123,6 +308,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/lastzip - Получить последний архив прошивки\n"
         "/buildinfo - Информация о последней сборке\n"
         "/patchlist - Список патчей для сборки\n"
+        "/patchlist check - Проверить применимость патчей\n"
         "/help - Показать справку"
     )
     
@@ -142,6 +328,152 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 build_process = None
 
+class BuildOutputParser:
+    """Разбор вывода build.sh: имя ядра, путь к образу, этап и ошибки"""
+    MARKERS = re.compile(rb"^[ \t]*(Using kernel name|Kernel image):[ \t]*(.*?)[ \t\r]*$", re.M)
+    PHASE_NAMES = (b"Applying patches", b"Configuring kernel", b"Optimizing config", b"Building kernel")
+    PHASES = re.compile(rb"^(" + b"|".join(PHASE_NAMES) + rb")", re.M)
+    ERRORS = re.compile(rb"\berror:|\*\*\*.*\bError \d+|build failed", re.I)
+    # Полный ERRORS проверяется только для строк с одной из этих подстрок
+    ERROR_HINTS = (b"rror", b"RROR", b"uild failed", b"UILD FAILED")
+    MAX_ERRORS = 5
+
+    def __init__(self):
+        self.kernel_name = None
+        self.image_path = None
+        self.phase = None
+        self.errors = deque(maxlen=self.MAX_ERRORS)
+
+    def feed(self, block: bytes):
+        if b"Using kernel name:" in block or b"Kernel image:" in block:
+            self._feed_markers(block)
+        if any(name in block for name in self.PHASE_NAMES):
+            self._feed_phases(block)
+        for line in self._error_lines(block):
+            error = line.decode(errors='replace').strip()[:200]
+            self.errors.append(error)
+            logger.warning(f"Build error: {error}")
+
+    def _feed_markers(self, block: bytes):
+        for match in self.MARKERS.finditer(block):
+            value = match.group(2).decode(errors='replace')
+            if match.group(1) == b"Using kernel name":
+                self.kernel_name = value
+            else:
+                self.image_path = value
+
+    def _feed_phases(self, block: bytes):
+        for match in self.PHASES.finditer(block):
+            phase = match.group(1).decode()
+            if phase != self.phase:
+                self.phase = phase
+                logger.info(f"Build phase: {phase}")
+
+    def _error_lines(self, block: bytes):
+        """Строки с ошибками в порядке вывода; регулярка только для строк-кандидатов"""
+        found = {}
+        for hint in self.ERROR_HINTS:
+            pos = block.find(hint)
+            while pos != -1:
+                start = block.rfind(b"\n", 0, pos) + 1
+                end = block.find(b"\n", pos)
+                if end == -1:
+                    end = len(block)
+                if start not in found:
+                    line = block[start:end]
+                    found[start] = line if self.ERRORS.search(line) else None
+                pos = block.find(hint, end)
+        return [found[start] for start in sorted(found) if found[start] is not None]
+
+class BuildLogWriter(threading.Thread):
+    """Фоновая запись лога сборки блоками через ограниченную очередь"""
+
+    def __init__(self, log_file):
+        super().__init__(name="build-log-writer", daemon=True)
+        self.log_file = log_file
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.subscribers = []
+        self.lines = 0
+        self.busy_time = 0.0
+        self.error = None
+
+    def subscribe(self, callback):
+        """Подписчик получает каждый блок целых строк (bytes)"""
+        self.subscribers.append(callback)
+
+    def submit(self, block: bytes):
+        # При заполненной очереди читатель ждёт, пока writer не освободит место
+        self._put(block)
+
+    def close(self):
+        self._put(None)
+        self.join()
+
+    def _put(self, item):
+        # Если поток записи упал, очередь никто не разбирает: блоки отбрасываются,
+        # чтобы build.sh не встал на заполненном пайпе
+        while self.is_alive():
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.busy_time if self.busy_time else 0.0
+
+    def run(self):
+        try:
+            self._consume()
+        except Exception as e:
+            self.error = e
+            logger.exception("Build log writer failed")
+
+    def _consume(self):
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            # Забираем всё, что уже накопилось, чтобы писать одним вызовом
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                done = True
+                batch = batch[:batch.index(None)]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            block = b"".join(batch)
+            self.log_file.write(block)
+            self.lines += block.count(b"\n")
+            for callback in self.subscribers:
+                try:
+                    callback(block)
+                except Exception:
+                    logger.exception("Build log subscriber failed")
+            self.busy_time += time.perf_counter() - started
+        self.log_file.flush()
+
+def pump_build_output(stream, writer: BuildLogWriter):
+    """Чтение вывода сборки крупными блоками, в writer уходят только целые строки"""
+    fd = stream.fileno()
+    tail = b""
+    while True:
+        chunk = os.read(fd, LOG_CHUNK_SIZE)
+        if not chunk:
+            break
+        cut = chunk.rfind(b"\n") + 1
+        if not cut:
+            tail += chunk
+            continue
+        writer.submit(tail + chunk[:cut] if tail else chunk[:cut])
+        tail = chunk[cut:]
+    if tail:
+        writer.submit(tail + b"\n")
+
 async def build_kernel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global build_process
     user = update.effective_user
@@ -149,75 +481,95 @@ async def build_kernel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     commit = repo.head.commit.hexsha[:8]
     branch = repo.active_branch.name
     build_start = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    chat_id = update.effective_chat.id
     logger.info(f"Build requested by {user.full_name} (ID: {user.id}), git: {branch} {commit}, time: {build_start}")
-    await update.message.reply_text(f"⚙️ *Запускаю сборку ядра...*\nGit: `{branch}` `{commit}`\nВремя: {build_start}", parse_mode='Markdown')
+    # Проверяем патчи до того, как build.sh очистит out и начнёт подготовку
+    try:
+        patch_results = await check_patches()
+    except Exception:
+        logger.exception("Patch check failed, continuing with build")
+        patch_results = []
+    if any(result["status"] == "conflict" for result in patch_results):
+        report = format_patch_report(patch_results)
+        notifier.notify("failure", f"⛔️ *Сборка не запущена: конфликт патчей*\n\n{report}", chat_id)
+        send_to_esp8266("Patch Conflict")
+        return
+    notifier.notify("started", f"⚙️ *Запускаю сборку ядра...*\nGit: `{branch}` `{commit}`\nВремя: {build_start}", chat_id)
     send_to_esp8266("Build Started")
     log_filename = f"build_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
     log_path = os.path.join(LOG_DIR, log_filename)
-    kernel_name = None
-    image_path = None
+    parser = BuildOutputParser()
+    loop = asyncio.get_running_loop()
+    last_phase = None
+
+    def report_progress(block):
+        # Вызывается из потока writer'а после parser.feed
+        nonlocal last_phase
+        if parser.phase != last_phase:
+            last_phase = parser.phase
+            loop.call_soon_threadsafe(notifier.notify, "progress", f"🔄 *Этап сборки:* {last_phase}", chat_id)
+
     try:
-        with open(log_path, 'w') as log_file:
-            log_file.write(f"Build started by: {user.full_name} (ID: {user.id})\n")
-            log_file.write(f"Git branch: {branch}\nGit commit: {commit}\nStart time: {build_start}\n\n")
-            build_process = subprocess.Popen(
-                ["./build.sh"],
-                cwd=PROJECT_DIR,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True
-            )
-            while True:
-                output = build_process.stdout.readline()
-                if output == '' and build_process.poll() is not None:
-                    break
-                if output:
-                    log_file.write(output)
-                    logger.info(output.strip())
-                    if output.startswith("Using kernel name:"):
-                        kernel_name = output.strip().split(":",1)[-1].strip()
-                    elif output.strip().startswith("Kernel image:"):
-                        image_path = output.strip().split(":",1)[-1].strip()
+        with open(log_path, 'wb') as log_file:
+            log_file.write(f"Build started by: {user.full_name} (ID: {user.id})\n".encode())
+            log_file.write(f"Git branch: {branch}\nGit commit: {commit}\nStart time: {build_start}\n\n".encode())
+            writer = BuildLogWriter(log_file)
+            writer.subscribe(parser.feed)
+            writer.subscribe(report_progress)
+            writer.start()
+            try:
+                process = build_process = subprocess.Popen(
+                    ["./build.sh"],
+                    cwd=PROJECT_DIR,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT
+                )
+                # Чтение пайпа и ожидание процесса не блокируют event loop
+                try:
+                    await asyncio.to_thread(pump_build_output, process.stdout, writer)
+                finally:
+                    process.stdout.close()
+                await asyncio.to_thread(process.wait)
+            finally:
+                await asyncio.to_thread(writer.close)
+        if writer.error:
+            raise writer.error
+        logger.info(f"Build log: {writer.lines} lines, {writer.lines_per_second:.0f} lines/s")
         build_end = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         with open(log_path, 'a') as log_file:
-            log_file.write(f"\nBuild finished at: {build_end}\n")
-        if build_process.returncode == 0:
-            await update.message.reply_text(f"✅ *Сборка завершена успешно!*\nGit: `{branch}` `{commit}`\nВремя: {build_end}", parse_mode='Markdown')
+            log_file.write(f"\nLog lines: {writer.lines} ({writer.lines_per_second:.0f} lines/s)\n")
+            log_file.write(f"Build finished at: {build_end}\n")
+        kernel_name = parser.kernel_name
+        image_path = parser.image_path
+        if process.returncode == 0:
+            notifier.notify("success", f"✅ *Сборка завершена успешно!*\nGit: `{branch}` `{commit}`\nВремя: {build_end}", chat_id)
             send_to_esp8266("Build Success")
-            zip_msg = await pack_and_send_zip(context, update, kernel_name, image_path)
-            await update.message.reply_text(zip_msg, parse_mode='Markdown')
+            zip_msg = await pack_and_send_zip(chat_id, kernel_name, image_path)
+            notifier.notify("success", zip_msg, chat_id)
             send_to_esp8266("Zip OK")
-            with open(log_path, "rb") as f:
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=InputFile(f, filename=log_filename),
-                    caption=f"Лог сборки: {log_filename}"
-                )
+            notifier.notify_document("success", log_path, log_filename, f"Лог сборки: {log_filename}", chat_id)
         else:
-            await update.message.reply_text(f"❌ *Сборка завершилась с ошибкой!*\nGit: `{branch}` `{commit}`\nВремя: {build_end}", parse_mode='Markdown')
+            fail_msg = f"❌ *Сборка завершилась с ошибкой!*\nGit: `{branch}` `{commit}`\nВремя: {build_end}"
+            if parser.errors:
+                errors_text = "\n".join(parser.errors).replace("`", "'")
+                fail_msg += f"\n```\n{errors_text}\n```"
+            notifier.notify("failure", fail_msg, chat_id)
             send_to_esp8266("Build Failed")
-            with open(log_path, "rb") as f:
-                await context.bot.send_document(
-                    chat_id=update.effective_chat.id,
-                    document=InputFile(f, filename=log_filename),
-                    caption=f"Лог ошибки: {log_filename}"
-                )
+            notifier.notify_document("failure", log_path, log_filename, f"Лог ошибки: {log_filename}", chat_id)
     except subprocess.TimeoutExpired:
         error_msg = "🕒 *Превышено время ожидания сборки (30 минут)*"
-        await update.message.reply_text(error_msg, parse_mode='Markdown')
+        notifier.notify("failure", error_msg, chat_id)
         send_to_esp8266("Timeout Error")
     except Exception as e:
         error_msg = f"⚠️ *Критическая ошибка:* {str(e)}"
-        await update.message.reply_text(error_msg, parse_mode='Markdown')
+        notifier.notify("failure", error_msg, chat_id)
         send_to_esp8266("Critical Error")
         logger.exception("Build failed")
     finally:
         build_process = None
         cleanup_old_logs()
 
-async def pack_and_send_zip(context, update, kernel_name, image_path):
+async def pack_and_send_zip(chat_id, kernel_name, image_path):
     try:
         anykernel_dir = os.path.join(PROJECT_DIR, "AnyKernel")
         zips_dir = os.path.join(PROJECT_DIR, "zips")
@@ -241,13 +593,8 @@ async def pack_and_send_zip(context, update, kernel_name, image_path):
             return f"❌ Ошибка: zip-файл не создан ({zip_name})"
         size_mb = os.path.getsize(zip_path) / (1024*1024)
         caption = f"Готовый архив для прошивки\nЯдро: {kernel_name}\nРазмер: {size_mb:.2f} MB\nДата: {date_str}"
-        with open(zip_path, "rb") as fzip:
-            await context.bot.send_document(
-                chat_id=update.effective_chat.id,
-                document=InputFile(fzip, filename=zip_name),
-                caption=caption
-            )
-        return f"✅ Архив создан и отправлен.\nИмя: {zip_name}\nРазмер: {size_mb:.2f} MB"
+        notifier.notify_document("success", zip_path, zip_name, caption, chat_id)
+        return f"✅ Архив создан и поставлен в очередь отправки.\nИмя: {zip_name}\nРазмер: {size_mb:.2f} MB"
     except Exception as e:
         logger.exception("Ошибка при упаковке/отправке zip")
         return f"❌ Ошибка при упаковке/отправке zip: {e}"
@@ -351,6 +698,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "*/lastzip* - Получить последний архив прошивки\n"
         "*/buildinfo* - Информация о последней сборке\n"
         "*/patchlist* - Список патчей для сборки\n"
+        "*/patchlist check* - Проверить применимость патчей\n"
         "*/help* - Эта справка"
     )
     
@@ -586,7 +934,7 @@ async def get_build_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         response = f"\U0001F4CB *Информация о последних сборках*\n\nТекущий git: `{branch}` `{commit}`\n\n"
         for log_name in logs[:3]:
             log_path = os.path.join(LOG_DIR, log_name)
-            with open(log_path, 'r') as f:
+            with open(log_path, 'r', errors='replace') as f:
                 lines = f.readlines()
             kernel_name = "Неизвестно"
             build_status = "Неизвестно"
@@ -624,8 +972,208 @@ async def get_build_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"Ошибка при получении информации о сборках: {e}")
 
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+HUNK_FAILED = re.compile(r"^Hunk #(\d+) FAILED")
+PATCH_STATUS_LABELS = {
+    "applies": "✅ применяется",
+    "applied": "☑️ уже применён",
+    "conflict": "❌ конфликт",
+}
+MAX_HUNK_CHARS = 1500
+MAX_PATCH_REPORT_CHARS = 3800
+patch_check_cache = {}
+patch_check_pool = None
+
+def parse_patch(patch_text: str):
+    """Целевые файлы патча и их хунки: {путь: [текст хунка, ...]} (для -p1)"""
+    files = {}
+    lines = patch_text.splitlines()
+    current = None
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            old = line[4:].split("\t", 1)[0].strip()
+            new = lines[i + 1][4:].split("\t", 1)[0].strip()
+            target = old if new == "/dev/null" else new
+            current = files.setdefault(target.split("/", 1)[-1], [])
+            i += 2
+            continue
+        match = HUNK_HEADER.match(line)
+        if match and current is not None:
+            old_left = int(match.group(1) or 1)
+            new_left = int(match.group(2) or 1)
+            hunk = [line]
+            i += 1
+            while i < len(lines) and (old_left > 0 or new_left > 0):
+                body = lines[i]
+                hunk.append(body)
+                i += 1
+                if body.startswith("-"):
+                    old_left -= 1
+                elif body.startswith("+"):
+                    new_left -= 1
+                elif not body.startswith("\\"):
+                    old_left -= 1
+                    new_left -= 1
+            current.append("\n".join(hunk))
+            continue
+        i += 1
+    return files
+
+def run_patch(snapshot: str, patch_path: str, *flags):
+    return subprocess.run(
+        ["patch", "-p1", "--force", "--no-backup-if-mismatch", "-d", snapshot, "-i", patch_path, *flags],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "LC_ALL": "C"}
+    )
+
+def patch_conflict(output: str, hunks):
+    """Разбор вывода patch: файл и первый не применившийся хунк"""
+    result = {"status": "conflict", "file": None, "hunk": None, "detail": output.strip()[-500:]}
+    checking = None
+    for line in output.splitlines():
+        if line.startswith("checking file "):
+            checking = line[len("checking file "):].strip()
+        elif line.startswith("can't find file to patch"):
+            result["detail"] = "Файл для патча не найден в дереве ядра"
+            break
+        else:
+            match = HUNK_FAILED.match(line)
+            if match and checking in hunks:
+                index = int(match.group(1)) - 1
+                result["file"] = checking
+                if index < len(hunks[checking]):
+                    result["hunk"] = hunks[checking][index][:MAX_HUNK_CHARS]
+                break
+    return result
+
+def check_patch_series(patch_paths, kernel_dir: str):
+    """Серия патчей с общими файлами на одной копии дерева, по порядку (в пуле процессов)"""
+    series = []
+    for patch_path in patch_paths:
+        with open(patch_path, encoding="utf-8", errors="replace") as f:
+            series.append((patch_path, parse_patch(f.read())))
+    results = []
+    with tempfile.TemporaryDirectory() as snapshot:
+        for rel_path in {rel_path for _, hunks in series for rel_path in hunks}:
+            src = os.path.join(kernel_dir, rel_path)
+            if os.path.isfile(src):
+                dst = os.path.join(snapshot, rel_path)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                shutil.copy2(src, dst)
+        for patch_path, hunks in series:
+            forward = run_patch(snapshot, patch_path, "--dry-run")
+            if forward.returncode == 0:
+                # Применяем в копии, чтобы следующие патчи серии видели изменения
+                applied = run_patch(snapshot, patch_path)
+                if applied.returncode == 0:
+                    results.append({"status": "applies"})
+                else:
+                    results.append(patch_conflict(applied.stdout, hunks))
+            elif run_patch(snapshot, patch_path, "--dry-run", "--reverse").returncode == 0:
+                results.append({"status": "applied"})
+            else:
+                results.append(patch_conflict(forward.stdout, hunks))
+    return results
+
+def get_kernel_head():
+    try:
+        return Repo(KERNEL_DIR).head.commit.hexsha
+    except Exception:
+        return None
+
+def patch_targets_fingerprint(rel_paths):
+    """mtime/размер целевых файлов: кэш сбрасывается, если build.sh уже менял дерево"""
+    fingerprint = []
+    for rel_path in sorted(rel_paths):
+        try:
+            st = os.stat(os.path.join(KERNEL_DIR, rel_path))
+            fingerprint.append((rel_path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            fingerprint.append((rel_path, None, None))
+    return tuple(fingerprint)
+
+def plan_patch_checks(patch_paths, kernel_head):
+    """Группы патчей с общими файлами и ключи кэша (хэш префикса серии, HEAD, файлы)"""
+    groups = []  # [(множество файлов, [(индекс, путь, хэш, файлы), ...])]
+    for index, patch_path in enumerate(patch_paths):
+        with open(patch_path, 'rb') as f:
+            data = f.read()
+        targets = set(parse_patch(data.decode(errors='replace')))
+        files = set(targets)
+        members = [(index, patch_path, hashlib.sha256(data).hexdigest(), targets)]
+        for group in [group for group in groups if group[0] & targets]:
+            groups.remove(group)
+            files |= group[0]
+            members += group[1]
+        groups.append((files, members))
+    plan = []
+    for _, members in groups:
+        members.sort()
+        prefix = hashlib.sha256()
+        prefix_files = set()
+        checks = []
+        for _, patch_path, digest, targets in members:
+            prefix.update(digest.encode())
+            prefix_files |= targets
+            key = (prefix.hexdigest(), kernel_head, patch_targets_fingerprint(prefix_files))
+            checks.append((patch_path, key))
+        plan.append(checks)
+    return plan
+
+async def check_patches():
+    """Проверка патчей: группы с общими файлами последовательно, разные группы параллельно"""
+    global patch_check_pool
+    if not os.path.isdir(PATCHES_DIR):
+        return []
+    patch_files = sorted(f for f in os.listdir(PATCHES_DIR) if f.endswith('.patch'))
+    if not patch_files:
+        return []
+    if patch_check_pool is None:
+        patch_check_pool = ProcessPoolExecutor()
+    loop = asyncio.get_running_loop()
+    kernel_head = await asyncio.to_thread(get_kernel_head)
+    patch_paths = [os.path.join(PATCHES_DIR, name) for name in patch_files]
+    plan = await asyncio.to_thread(plan_patch_checks, patch_paths, kernel_head)
+
+    async def check(checks):
+        if any(key not in patch_check_cache for _, key in checks):
+            results = await loop.run_in_executor(
+                patch_check_pool, check_patch_series, [path for path, _ in checks], KERNEL_DIR
+            )
+            for (_, key), result in zip(checks, results):
+                patch_check_cache[key] = result
+        return [{"patch": os.path.basename(path), **patch_check_cache[key]} for path, key in checks]
+
+    grouped = await asyncio.gather(*(check(checks) for checks in plan))
+    return sorted((result for results in grouped for result in results), key=lambda result: result["patch"])
+
+def format_patch_report(results):
+    response = ""
+    for shown, result in enumerate(results):
+        entry = f"{PATCH_STATUS_LABELS[result['status']]} `{result['patch']}`\n"
+        if result["status"] == "conflict":
+            if result.get("file"):
+                entry += f"Файл: `{result['file']}`\n"
+            text = result.get("hunk") or result.get("detail")
+            if text:
+                text = text.replace("`", "'")
+                entry += f"```\n{text}\n```\n"
+        # Обрезаем только между записями, чтобы не ломать Markdown
+        if len(response) + len(entry) > MAX_PATCH_REPORT_CHARS:
+            response += f"\n... и еще {len(results) - shown} патчей"
+            break
+        response += entry
+    return response
+
 async def list_patches(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать список патчей для сборки"""
+    """Показать список патчей для сборки; /patchlist check - проверить применимость"""
+    if context.args and context.args[0] == "check":
+        await check_patch_list(update, context)
+        return
     try:
         patches_dir = os.path.join(PROJECT_DIR, "patches")
         if not os.path.exists(patches_dir):
@@ -652,6 +1200,19 @@ async def list_patches(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         await update.message.reply_text(f"Ошибка при получении списка патчей: {e}")
 
+async def check_patch_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Проверить, применяются ли патчи к текущему дереву ядра"""
+    try:
+        results = await check_patches()
+        if not results:
+            await update.message.reply_text("Патчи не найдены.")
+            return
+        response = f"🔍 *Проверка патчей:*\n\n{format_patch_report(results)}"
+        await update.message.reply_text(response, parse_mode='Markdown')
+    except Exception as e:
+        logger.exception("Patch check failed")
+        await update.message.reply_text(f"Ошибка при проверке патчей: {e}")
+
 async def getlogfile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text("Укажи имя лога: /getlog <имя_лога>")
@@ -675,7 +1236,9 @@ async def getlogfile(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def main():
     application = ApplicationBuilder() \
         .token(BOT_TOKEN) \
-        .post_init(setup_commands) \
+        .post_init(post_init) \
+        .post_stop(post_stop) \
+        .post_shutdown(post_shutdown) \
         .build()
     
     # Основные команды